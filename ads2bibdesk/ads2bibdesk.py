@@ -7,25 +7,63 @@ import sys
 
 import argparse
 
+import concurrent.futures
 import difflib
 import logging
+import shutil
 import tempfile
+import threading
 import subprocess
-import socket
+import shlex
+import json
+import time
+import urllib.parse
 
 # Dependent
 
 import ads
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from lxml import html
 
-from .bibdesk import BibDesk
+try:
+    # optional: C++ string matching, much faster than difflib on large libraries
+    from rapidfuzz import fuzz, process
+except ImportError:
+    fuzz = process = None
+
+try:
+    # optional: libmagic bindings, only used to describe non-PDF downloads
+    import magic
+except ImportError:
+    magic = None
+
+from .bibdesk import BibDesk, tokenize
 from .prefs import Preferences
 from . import __version__
 
 import logging
 logger = logging.getLogger(__name__)
 
+USER_AGENT = ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_5) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/68.0.3440.106 Safari/537.36')
+
+# (connect, read) timeouts in seconds, so an unresponsive host can't stall the download
+TIMEOUT = (10, 60)
+
+# shared by all downloads: keeps connections alive and retries transient server errors
+SESSION = requests.Session()
+SESSION.headers.update({'User-Agent': USER_AGENT})
+for prefix in ['https://', 'http://']:
+    SESSION.mount(prefix, HTTPAdapter(pool_connections=4, pool_maxsize=5,
+                                      max_retries=Retry(total=2, backoff_factor=0.3,
+                                                        status_forcelist=[500, 502, 503, 504])))
+
+# cache files live in this subdirectory of cache_dir, and are the only files prune_cache() removes
+CACHE_SUBDIR = 'ads2bibdesk'
+CACHE_SUFFIXES = ('.json', '.pdf')
+
 
 def main():
     """
@@ -56,6 +94,10 @@ The API key can be set with the following options:
                         dest="debug", action="store_true",
                         help="Debug mode; prints extra statements")
 
+    parser.add_argument('-n', '--no-cache',
+                        dest="no_cache", action="store_true",
+                        help="Ignore the local cache; query ADS and download the PDF again")
+
     parser.add_argument('article_identifier', type=str,
                         help="""The identifier of an article could be:
   - ADS bibcode (e.g. 1998ApJ...500..525S, 2019arXiv190404507R)
@@ -72,6 +114,9 @@ The API key can be set with the following options:
     if args.debug == True:
         prefs['options']['debug'] = 'True'
 
+    if args.no_cache == True:
+        prefs['cache']['cache_days'] = '0'
+
     """
     logging.basicConfig(
         level=logging.DEBUG,
@@ -97,6 +142,8 @@ The API key can be set with the following options:
     toplogger.addHandler(ch)
 
     if 'true' not in prefs['options']['debug'].lower():
+        # also lets logger.isEnabledFor(logging.DEBUG) skip building debug payloads
+        toplogger.setLevel(logging.INFO)
         ch.setLevel(logging.INFO)
         fh.setLevel(logging.INFO)
         ch.setFormatter('')
@@ -108,6 +155,8 @@ The API key can be set with the following options:
     logger.debug("ADS to BibDesk version {}".format(__version__))
     logger.debug("Python: {}".format(sys.version))
 
+    prune_cache(prefs)
+
     article_status = process_article(args, prefs)
 
 
@@ -117,18 +166,17 @@ class CustomFormatter(logging.Formatter):
     """
 
     def format(self, record: logging.LogRecord):
-        save_msg = record.msg
+        # merge lazy %-style arguments before splitting the lines
+        save_msg = record.getMessage()
         output = []
         datefmt = '%Y-%m-%d %H:%M:%S'
         s = "{} {:<32} {:<8} : ".format(self.formatTime(record, datefmt),
                                         record.name+'.'+record.funcName,
                                         "[" + record.levelname + "]")
         for line in save_msg.splitlines():
-            record.msg = line
             output.append(s+line)
 
         output = '\n'.join(output)
-        record.msg = save_msg
         record.message = output
 
         return output
@@ -142,7 +190,7 @@ def process_article(args, prefs):
 
     article_status = process_token(args.article_identifier, prefs, bibdesk)
 
-    bibdesk.app.dealloc()
+    bibdesk.close()
 
     return article_status
 
@@ -174,57 +222,24 @@ def process_token(article_identifier, prefs, bibdesk):
     if 'dev_key' not in prefs['default']['ads_token']:
         ads.config.token = prefs['default']['ads_token']
 
-    #   field-id list:
-    #       https://github.com/adsabs/adsabs-dev-api/blob/master/Search_API.ipynb
-    #       https://adsabs.github.io/help/search/comprehensive-solr-term-list
-
-    ads_query = ads.SearchQuery(identifier=article_identifier,
-                                fl=['author', 'first_author',
-                                    'bibcode', 'identifier', 'alternate_bibcode', 'id',
-                                    'year', 'title', 'abstract', 'links_data', 'esources', 'bibstem'])
-    try:
-        ads_articles = list(ads_query)
-    except:
-        logger.info("API response error, Likely no authorized key is provided!")
-        notify('API response error', 'key:'+prefs['default']['ads_token'],
-               'Likely no authorized key is provided!', alert_sound=alert_sound)
-        return False
-
-    if len(ads_articles) != 1:
-        logger.debug(
-            ' Zero or Multiple ADS entries for the article identifiier: {}'.format(article_identifier))
-        logger.debug('Matching Number: {}'.format(len(ads_articles)))
-        notify('Found Zero or Multiple ADS antries for ',
-               article_identifier, ' No update in BibDesk', alert_sound=alert_sound)
-        logger.info("Found Zero or Multiple ADS antries for {}".format(
-            article_identifier))
-        logger.info("No update in BibDesk")
+    ads_article, ads_bibtex = read_cache(article_identifier, prefs)
 
-        return False
-
-    ads_article = ads_articles[0]
-
-    use_bibtexabs = False
-    #   use "bibtex" by default
-    #   another option could be "bibtexabs":
-    #       https://github.com/andycasey/ads/pull/109
-    #   however, a change in ads() is required and the abstract field from the "bibtexabs" option doesn't
-    #   always comply with the tex syntax.
-    if use_bibtexabs == True:
-        ads_bibtex = ads.ExportQuery(
-            bibcodes=ads_article.bibcode, format='bibtexabs').execute()
+    if ads_article is None:
+        ads_article, ads_bibtex = query_ads(article_identifier, prefs,
+                                            alert_sound=alert_sound)
+        if ads_article is None:
+            return False
+        write_cache(article_identifier, ads_article, ads_bibtex, prefs)
     else:
-        ads_bibtex = ads.ExportQuery(
-            bibcodes=ads_article.bibcode, format='bibtex').execute()
+        logger.debug("loaded from cache >>> {}".format(article_identifier))
 
-    logger.debug(">>>API limits")
-    logger.debug("   {}".format(ads_query.response.get_ratelimits()))
-    logger.debug(">>>ads_bibtex")
-    logger.debug("   {}".format(ads_bibtex))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(">>>ads_bibtex")
+        logger.debug("   %s", ads_bibtex)
 
-    for k, v in ads_article.items():
-        logger.debug('>>>{}'.format(k))
-        logger.debug('   {}'.format(v))
+        for k, v in ads_article.items():
+            logger.debug('>>>%s', k)
+            logger.debug('   %s', v)
 
     article_bibcode = ads_article.bibcode
     article_esources = ads_article.esources
@@ -239,103 +254,118 @@ def process_token(article_identifier, prefs, bibdesk):
     kept_fields = {}
     kept_groups = []
 
-    found = difflib.get_close_matches(
-        ads_article.title[0], bibdesk.titles, n=1, cutoff=.7)
+    found = get_close_title(ads_article.title[0], bibdesk, cutoff=.7)
 
     # first author is the same
-    if len(found) > 0:
-        if found and difflib.SequenceMatcher(
-                None,
-                bibdesk.authors(bibdesk.pid(found[0]))[0],
-                ads_article.author[0]).ratio() > .6:
+    if found is not None:
+        pid = bibdesk.pid(found)
+        snapshot = bibdesk.snapshot(pid)
+        if similarity(snapshot['authors'][0],
+                      ads_article.author[0]) > .6:
             # further comparison on abstract
-            abstract = bibdesk('abstract', bibdesk.pid(found[0])).stringValue()
-            if not abstract or difflib.SequenceMatcher(
-                    None, abstract,
-                    ads_article.abstract).ratio() > .6:
-                pid = bibdesk.pid(found[0])
+            abstract = snapshot['abstract']
+            if not abstract or token_jaccard(abstract,
+                                             ads_article.abstract) > .5:
                 kept_groups = bibdesk.get_groups(pid)
                 # keep all fields for later comparison
                 # (especially rating + read bool)
                 kept_fields = dict((k, v) for k, v in
-                                   zip(bibdesk('return name of fields', pid, True),
-                                       bibdesk('return value of fields', pid, True))
+                                   zip(snapshot['field_names'],
+                                       snapshot['field_values'])
                                    # Adscomment may be arXiv only
                                    if k != 'Adscomment')
                 # plus BibDesk annotation
-                kept_fields['BibDeskAnnotation'] = bibdesk(
-                    'return its note', pid).stringValue()
+                kept_fields['BibDeskAnnotation'] = snapshot['note']
 
                 if 'true' in prefs['options']['remove_duplicate'].lower():
                     notify('Duplicate publication removed',
-                           bibdesk('cite key', pid).stringValue(), ads_article.title[0], alert_sound=alert_sound)
+                           snapshot['cite_key'], ads_article.title[0], alert_sound=alert_sound)
                     logger.info('Duplicate publication removed:')
-                    logger.info(bibdesk('cite key', pid).stringValue())
+                    logger.info(snapshot['cite_key'])
                     logger.info(ads_article.title[0])
 
                     kept_pdfs += bibdesk.safe_delete(pid)
 
                 bibdesk.refresh()
 
-    # add new entry
-    ads_bibtex_clean = ads_bibtex.replace('\\', r'\\').replace('"', r'\"')
-    pub = bibdesk(f'import from "{ads_bibtex_clean}"')
+    # add new entry (passed as a script parameter, so no quoting is needed)
+    pub = bibdesk('import from item 1 of args', args=[ads_bibtex])
 
     # pub id
     pub = pub.descriptorAtIndex_(1).descriptorAtIndex_(3).stringValue()
 
     # automatic cite key
-    bibdesk('set cite key to generated cite key', pub)
+    #   each command that changes the publication runs in its own try block, so that a
+    #   failure is skipped, as with separate calls, rather than aborting the whole script
+    cmds, args = ['try', 'set cite key to generated cite key', 'end try'], []
 
     # abstract
     if ads_article.abstract is not None:
-        ads_abstract_clean = ads_article.abstract.replace('\\', r'\\').replace(
-            '"', r'\"').replace('}', ' ').replace('{', ' ')
-        bibdesk(f'set abstract to "{ads_abstract_clean}"', pub)
+        ads_abstract_clean = ads_article.abstract.replace('}', ' ').replace('{', ' ')
+        cmds += ['try', 'set abstract to item 1 of args', 'end try']
+        args += [ads_abstract_clean]
 
-    doi = bibdesk('value of field "doi"', pub).stringValue()
+    doi = bibdesk(cmds + ['return value of field "doi"'], pub, args=args).stringValue()
 
+    cmds, args = [], []
     if pdf_filename.endswith('.pdf') and pdf_status:
         # register PDF into BibDesk
-        bibdesk(
-            f'add POSIX file "{pdf_filename}" to beginning of linked files', pub)
+        cmds += ['try', 'add (POSIX file (item 1 of args)) to beginning of linked files', 'end try']
         # automatic file name
-        bibdesk('auto file', pub)
+        cmds += ['try', 'auto file', 'end try']
+        args += [pdf_filename]
     elif 'http' in pdf_filename and not doi:
         # URL for electronic version - only add it if no DOI link present
         # (they are very probably the same)
-        bibdesk(
-            f'make new linked URL at end of linked URLs with data "{pdf_filename}"', pub)
+        cmds += ['try', 'make new linked URL at end of linked URLs with data (item 1 of args)',
+                 'end try']
+        args += [pdf_filename]
 
     # add URLs as linked URL if not there yet
-    urls = bibdesk('value of fields whose name ends with "url"',
-                   pub, strlist=True)
+    urls = bibdesk(cmds + ['return value of fields whose name ends with "url"'],
+                   pub, strlist=True, args=args)
     if 'EPRINT_HTML' in article_esources:
         urls += [get_esource_link(article_bibcode, esource_type='eprint_html')]
 
     urlspub = bibdesk('linked URLs', pub, strlist=True)
 
-    for u in [u for u in urls if u not in urlspub]:
-        bibdesk(
-            f'make new linked URL at end of linked URLs with data "{u}"', pub)
-
-    # add old annotated files
-    for kept_pdf in kept_pdfs:
-        bibdesk(f'add POSIX file "{kept_pdf}" to end of linked files', pub)
-
-    # re-insert custom fields
+    # add the missing linked URLs, old annotated files and the BibDesk annotation
     bibdesk_annotation = kept_fields.pop("BibDeskAnnotation", '')
-    bibdesk(f'set its note to "{bibdesk_annotation}"', pub)
-    newFields = bibdesk('return name of fields', pub, True)
-    for k, v in list(kept_fields.items()):
-        if k not in newFields:
-            bibdesk(f'set value of field "{(k, v)}" to "{pub}"')
+    newFields = set(bibdesk(['repeat with aURL in item 1 of args',
+                             'try',
+                             'make new linked URL at end of linked URLs with data (contents of aURL)',
+                             'end try',
+                             'end repeat',
+                             'repeat with aFile in item 2 of args',
+                             'try',
+                             'add (POSIX file (contents of aFile)) to end of linked files',
+                             'end try',
+                             'end repeat',
+                             'try',
+                             'set its note to item 3 of args',
+                             'end try',
+                             'return name of fields'],
+                            pub, True,
+                            args=[[u for u in urls if u not in urlspub],
+                                  kept_pdfs,
+                                  bibdesk_annotation]))
 
+    # re-insert custom fields
+    kept_fields = dict((k, v) for k, v in kept_fields.items() if k not in newFields)
+    if kept_fields:
+        # a field BibDesk refuses (e.g. a read-only one) must not skip the ones after it
+        bibdesk(['repeat with i from 1 to count of item 1 of args',
+                 'try',
+                 'set value of field (item i of item 1 of args) to (item i of item 2 of args)',
+                 'end try',
+                 'end repeat'],
+                pub, args=[list(kept_fields.keys()), list(kept_fields.values())])
+
+    cite_key = bibdesk('cite key', pub).stringValue()
     notify('New publication added',
-           bibdesk('cite key', pub).stringValue(),
-           ads_article.title[0], alert_sound=alert_sound)
+           cite_key, ads_article.title[0], alert_sound=alert_sound)
     logger.info('New publication added:')
-    logger.info(bibdesk('cite key', pub).stringValue())
+    logger.info(cite_key)
     logger.info(ads_article.title[0])
 
     # add back the static groups assignment
@@ -345,6 +375,266 @@ def process_token(article_identifier, prefs, bibdesk):
     return True
 
 
+def get_close_title(title, bibdesk, cutoff=.7, prefilter=.3):
+    """
+    Find the BibDesk title closest to `title`, or None if nothing reaches `cutoff`
+
+    Titles sharing too few words with `title` (Jaccard index < prefilter) are rejected
+    with cheap set operations first; only the remaining candidates are scored.
+    With rapidfuzz installed, the WRatio scorer is used on the joined word tokens.
+    Otherwise, same as difflib.get_close_matches(n=1), but on word tokens and with autojunk off:
+        the query is set as seq2 once (its b2j is reused for every candidate), and
+        real_quick_ratio()/quick_ratio() reject candidates before the full ratio()
+    """
+    if title in bibdesk.title_ids:
+        return title
+
+    title_tokens = tokenize(title)
+    title_shingles = set(title_tokens)
+    candidates = [idx for idx, shingles in enumerate(bibdesk.title_shingles)
+                  if jaccard(title_shingles, shingles) >= prefilter]
+    if not candidates:
+        return None
+
+    if process is not None:
+        # score the same lower-cased word tokens as the difflib path, so that both
+        # backends find the same duplicates
+        match = process.extractOne(' '.join(title_tokens),
+                                   [' '.join(bibdesk.title_tokens[idx]) for idx in candidates],
+                                   scorer=fuzz.WRatio, processor=None,
+                                   score_cutoff=cutoff*100)
+        return bibdesk.titles[candidates[match[2]]] if match else None
+
+    matcher = difflib.SequenceMatcher(autojunk=False)
+    matcher.set_seq2(title_tokens)
+
+    found = None
+    for idx in candidates:
+        matcher.set_seq1(bibdesk.title_tokens[idx])
+        if matcher.real_quick_ratio() >= cutoff and \
+                matcher.quick_ratio() >= cutoff:
+            ratio = matcher.ratio()
+            if ratio >= cutoff:
+                found, cutoff = bibdesk.titles[idx], ratio
+
+    return found
+
+
+def jaccard(a, b):
+    """
+    Jaccard index of two sets
+    """
+    return len(a & b) / max(1, len(a | b))
+
+
+def token_jaccard(a, b):
+    """
+    Jaccard index of the word sets of two strings: a linear-time check for
+        long texts (e.g. abstracts) where only "similar enough" matters
+    """
+    return jaccard(set(tokenize(a)), set(tokenize(b)))
+
+
+def similarity(a, b):
+    """
+    Character-level similarity of two short strings (e.g. author names), between 0 and 1:
+        the Indel-normalized fuzz.ratio with rapidfuzz, the Ratcliff/Obershelp ratio otherwise
+    """
+    if a == b:
+        return 1.0
+    if fuzz is not None:
+        return fuzz.ratio(a, b) / 100.0
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def query_ads(article_identifier, prefs, alert_sound=None):
+    """
+    Query the ADS metadata and BibTeX entry of an article
+    return (None, None) if ADS doesn't return a unique record
+    """
+
+    use_bibtexabs = False
+    #   use "bibtex" by default
+    #   another option could be "bibtexabs":
+    #       https://github.com/andycasey/ads/pull/109
+    #   however, a change in ads() is required and the abstract field from the "bibtexabs" option doesn't
+    #   always comply with the tex syntax.
+    export_format = 'bibtexabs' if use_bibtexabs == True else 'bibtex'
+
+    #   the search API can't return BibTeX, but if the identifier is already a bibcode,
+    #   the export query doesn't need to wait for the search results
+    export_future = None
+    if is_bibcode(article_identifier):
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        export_future = executor.submit(export_bibtex, article_identifier, export_format)
+        executor.shutdown(wait=False)
+
+    #   field-id list:
+    #       https://github.com/adsabs/adsabs-dev-api/blob/master/Search_API.ipynb
+    #       https://adsabs.github.io/help/search/comprehensive-solr-term-list
+
+    ads_query = ads.SearchQuery(identifier=article_identifier,
+                                fl=['author', 'first_author',
+                                    'bibcode', 'identifier', 'alternate_bibcode', 'id',
+                                    'year', 'title', 'abstract', 'links_data', 'esources', 'bibstem'])
+    try:
+        ads_articles = list(ads_query)
+    except:
+        logger.info("API response error, Likely no authorized key is provided!")
+        notify('API response error', 'key:'+prefs['default']['ads_token'],
+               'Likely no authorized key is provided!', alert_sound=alert_sound)
+        return None, None
+
+    if len(ads_articles) != 1:
+        logger.debug(
+            ' Zero or Multiple ADS entries for the article identifiier: {}'.format(article_identifier))
+        logger.debug('Matching Number: {}'.format(len(ads_articles)))
+        notify('Found Zero or Multiple ADS antries for ',
+               article_identifier, ' No update in BibDesk', alert_sound=alert_sound)
+        logger.info("Found Zero or Multiple ADS antries for {}".format(
+            article_identifier))
+        logger.info("No update in BibDesk")
+
+        return None, None
+
+    ads_article = ads_articles[0]
+
+    ads_bibtex = None
+    # an alternate bibcode (e.g. arXiv) resolves to a different canonical record
+    if export_future is not None and ads_article.bibcode == article_identifier:
+        try:
+            ads_bibtex = export_future.result()
+        except Exception:
+            logger.debug("concurrent export query failed, retrying")
+    if not ads_bibtex:
+        ads_bibtex = export_bibtex(ads_article.bibcode, export_format)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(">>>API limits")
+        logger.debug("   %s", ads_query.response.get_ratelimits())
+
+    return ads_article, ads_bibtex
+
+
+def get_cache_dir(prefs):
+    """
+    Directory owned by the cache: a dedicated subdirectory of cache_dir,
+        so that pruning never touches files the cache didn't write
+    """
+    return os.path.join(os.path.expanduser(prefs['cache']['cache_dir']), CACHE_SUBDIR)
+
+
+def get_cache_path(key, suffix, prefs):
+    """
+    Path of a cache file (e.g. ~/.ads/cache/ads2bibdesk/1998ApJ...500..525S.json);
+        return None if caching is disabled (cache_days = 0)
+    """
+    if float(prefs['cache']['cache_days']) <= 0:
+        return None
+    cache_dir = get_cache_dir(prefs)
+    try:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+    except OSError as err:
+        logger.debug("cache disabled >>> {}: {}".format(cache_dir, err))
+        return None
+    return os.path.join(cache_dir, urllib.parse.quote(key, safe='')+suffix)
+
+
+def is_cached(cache_path, prefs):
+    """
+    Check if a cache file exists and is younger than cache_days
+        an expired cache file is removed
+    """
+    if cache_path is None or not os.path.exists(cache_path):
+        return False
+    if time.time()-os.path.getmtime(cache_path) < float(prefs['cache']['cache_days'])*86400:
+        return True
+    remove_cache(cache_path)
+    return False
+
+
+def remove_cache(cache_path):
+    """
+    Remove a cache file, ignoring files that are already gone or can't be removed
+    """
+    try:
+        os.remove(cache_path)
+        logger.debug("removed expired cache >>> {}".format(cache_path))
+    except OSError:
+        pass
+
+
+def prune_cache(prefs):
+    """
+    Remove all cache files older than cache_days, so old PDFs don't pile up in the cache
+        only the .json/.pdf files in the cache's own subdirectory are considered
+    """
+    cache_days = float(prefs['cache']['cache_days'])
+    cache_dir = get_cache_dir(prefs)
+    if cache_days <= 0 or not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        if not name.endswith(CACHE_SUFFIXES):
+            continue
+        cache_path = os.path.join(cache_dir, name)
+        try:
+            expired = time.time()-os.path.getmtime(cache_path) >= cache_days*86400
+        except OSError:
+            continue
+        if expired and os.path.isfile(cache_path):
+            remove_cache(cache_path)
+
+
+def read_cache(article_identifier, prefs):
+    """
+    Load the ADS metadata and BibTeX entry saved by write_cache()
+    return (None, None) if there is no valid cache
+    """
+    cache_path = get_cache_path(article_identifier, '.json', prefs)
+    if not is_cached(cache_path, prefs):
+        return None, None
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+        return ads.search.Article(**cache['article']), cache['bibtex']
+    except (OSError, ValueError, KeyError):
+        logger.debug("ignore corrupted cache >>> {}".format(cache_path))
+        return None, None
+
+
+def write_cache(article_identifier, ads_article, ads_bibtex, prefs):
+    """
+    Save the ADS metadata and BibTeX entry of an article, keyed by its identifier
+        arXiv preprints are not cached, so that a later run picks up the published version
+    """
+    if 'arXiv' in ads_article.bibcode:
+        return
+    cache_path = get_cache_path(article_identifier, '.json', prefs)
+    if cache_path is not None:
+        try:
+            with open(cache_path, 'w') as f:
+                json.dump({'article': dict(ads_article.items()),
+                           'bibtex': ads_bibtex}, f)
+        except OSError as err:
+            logger.debug("cannot write cache >>> {}: {}".format(cache_path, err))
+
+
+def is_bibcode(article_identifier):
+    """
+    ADS bibcodes are 19 characters long and start with the publication year,
+        e.g. 1998ApJ...500..525S (unlike arXiv ids or dois)
+    """
+    return len(article_identifier) == 19 and article_identifier[:4].isdigit()
+
+
+def export_bibtex(article_bibcode, export_format='bibtex'):
+    """
+    Export the BibTeX entry of an ADS bibcode
+    """
+    return ads.ExportQuery(bibcodes=article_bibcode, format=export_format).execute()
+
+
 def process_pdf(article_bibcode, article_esources,
                 prefs=None,
                 esource_types=['pub_pdf', 'pub_html', 'eprint_pdf', 'ads_pdf', 'author_pdf']):
@@ -357,61 +647,131 @@ def process_pdf(article_bibcode, article_esources,
     esource_types:      the esource type order to try for PDF downloading
                         if one prefer arxiv pdf, set it to:
                             [eprint_pdf','pub_pdf','pub_html',ads_pdf']
+    prefs:              preferences (proxy + cache settings); without them, neither
+                        the ssh proxy nor the PDF cache is used
 
     """
 
+    # BibDesk moves the PDF it links (auto file), so always hand over a copy of the cache
+    cache_path = None if prefs is None else get_cache_path(article_bibcode, '.pdf', prefs)
+    if is_cached(cache_path, prefs) and 'PDF document' in get_filetype(cache_path):
+        fd, pdf_filename = tempfile.mkstemp(suffix='.pdf')
+        with os.fdopen(fd, 'wb') as f, open(cache_path, 'rb') as cache:
+            shutil.copyfileobj(cache, f)
+        logger.debug("loaded from cache >>> {}".format(cache_path))
+        return pdf_filename, True
+
+    # if esource_type is not available, we will not move forward.
+    article_esources = set(article_esources)
+    esource_urls = get_esource_links(article_bibcode,
+                                     [esource_type for esource_type in esource_types
+                                      if esource_type.upper() in article_esources])
+    esource_types = list(esource_urls)
+
+    # download from all esources at once, then go through them in the preferred order;
+    # once a PDF is picked, `cancel` makes the remaining downloads stop early
+    cancel = threading.Event()
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, len(esource_types)))
+    futures = [executor.submit(fetch_pdf, esource_url, esource_type, cancel=cancel)
+               for esource_type, esource_url in esource_urls.items()]
+    executor.shutdown(wait=False)
+
     pdf_status = False
     pdf_filename = '.null'
 
-    for esource_type in esource_types:
+    idx = 0
+    try:
+        for idx, (esource_type, future) in enumerate(zip(esource_types, futures)):
 
-        # if esource_type is not available, we will not move forward.
-        # if pub_pdf is available, we will not use pub_html.
+            pdf_url, pdf_filename, pdf_status = future.result()
 
-        if esource_type.upper() not in article_esources:
-            continue
+            if not pdf_status and 'pub' in esource_type and prefs is not None and \
+                    prefs['proxy']['ssh_user'] != 'None' and prefs['proxy']['ssh_server'] != 'None':
+                pdf_status = process_pdf_proxy(pdf_url, pdf_filename,
+                                               prefs['proxy']['ssh_user'],
+                                               prefs['proxy']['ssh_server'],
+                                               port=prefs['proxy']['ssh_port'])
 
-        esource_url = get_esource_link(
-            article_bibcode, esource_type=esource_type)
-
-        if esource_type == 'pub_html':
-            logger.debug("try >>> {}".format(esource_url))
-            response = requests.get(esource_url, allow_redirects=True,
-                                    headers={'User-Agent':
-                                             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_5) AppleWebKit/537.36 \
-                                    (KHTML, like Gecko) Chrome/68.0.3440.106 Safari/537.36'})
-            logger.debug("    >>> {}".format(response.url))
-            pdf_url = get_pdf_fromhtml(response)
-        else:
-            pdf_url = esource_url
+            if pdf_status == True:
+                if cache_path is not None:
+                    try:
+                        shutil.copyfile(pdf_filename, cache_path)
+                    except OSError as err:
+                        logger.debug("cannot write cache >>> {}: {}".format(cache_path, err))
+                break
 
-        logger.debug("try >>> {}".format(pdf_url))
-        response = requests.get(pdf_url, allow_redirects=True,
-                                headers={'User-Agent':
-                                         'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_5) AppleWebKit/537.36 \
-                                (KHTML, like Gecko) Chrome/68.0.3440.106 Safari/537.36'})
+            os.remove(pdf_filename)
+            pdf_filename = '.null'
+    finally:
+        # stop the downloads from the less preferred esources and drop their files
+        cancel.set()
+        for other in futures[idx+1:]:
+            other.add_done_callback(discard_pdf)
+
+    return pdf_filename, pdf_status
 
-        fd, pdf_filename = tempfile.mkstemp(suffix='.pdf')
-        if response.status_code != 404 and response.status_code != 403:
-            os.fdopen(fd, 'wb').write(response.content)
+
+def fetch_pdf(esource_url, esource_type, cancel=None):
+    """
+    Download the PDF behind an ADS esource link into a new temporary file
+    return the PDF url, the temporary filename, and whether a PDF was received
+        if `cancel` (a threading.Event) gets set, the download stops, its temporary file
+        is removed, and the returned filename is None
+    """
+    pdf_url = esource_url
+    cancelled = False
+    fd, pdf_filename = tempfile.mkstemp(suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            try:
+                if esource_type == 'pub_html':
+                    logger.debug("try >>> {}".format(esource_url))
+                    response = SESSION.get(esource_url, allow_redirects=True, timeout=TIMEOUT)
+                    logger.debug("    >>> {}".format(response.url))
+                    pdf_url = get_pdf_fromhtml(response)
+
+                logger.debug("try >>> {}".format(pdf_url))
+                # stream the PDF to disk rather than holding it in memory
+                with SESSION.get(pdf_url, allow_redirects=True, stream=True,
+                                 timeout=TIMEOUT) as response:
+                    if response.status_code != 404 and response.status_code != 403:
+                        for chunk in response.iter_content(chunk_size=64*1024):
+                            if cancel is not None and cancel.is_set():
+                                cancelled = True
+                                break
+                            f.write(chunk)
+            except Exception as err:
+                # e.g. a failed request, or a journal page lxml can't parse:
+                # this esource fails, the others go on
+                logger.debug("request failed >>> {}: {}".format(pdf_url, err))
+
+        if cancelled:
+            os.remove(pdf_filename)
+            logger.debug("try cancelled >>> {}".format(pdf_url))
+            return pdf_url, None, False
 
         if 'PDF document' in get_filetype(pdf_filename):
             pdf_status = True
             logger.debug("try succeeded >>> {}".format(pdf_url))
-            break
         else:
+            pdf_status = False
             logger.debug("try failed >>> {}".format(pdf_url))
+    except BaseException:
+        # don't leave the temporary file behind
+        if os.path.exists(pdf_filename):
+            os.remove(pdf_filename)
+        raise
 
-        if 'pub' in esource_type and \
-                prefs['proxy']['ssh_user'] != 'None' and prefs['proxy']['ssh_server'] != 'None':
-            pdf_status = process_pdf_proxy(pdf_url, pdf_filename,
-                                           prefs['proxy']['ssh_user'],
-                                           prefs['proxy']['ssh_server'],
-                                           port=prefs['proxy']['ssh_port'])
-            if pdf_status == True:
-                break
+    return pdf_url, pdf_filename, pdf_status
 
-    return pdf_filename, pdf_status
+
+def discard_pdf(future):
+    """
+    remove the temporary file of a PDF download that is no longer needed
+    """
+    if future.exception() is None and future.result()[1] is not None:
+        os.remove(future.result()[1])
 
 
 def get_pdf_fromhtml(response):
@@ -438,25 +798,21 @@ def get_pdf_fromhtml(response):
 
 
 def process_pdf_proxy(pdf_url, pdf_filename, user, server, port=22):
-
-    client = socket.gethostname().replace(' ', '')
-    tmpfile = '/tmp/adsbibdesk.{}.pdf'.format(client)
-    cmd1 = 'ssh -p {} {}@{} \"touch {}; '.format(port, user, server, tmpfile)
-    cmd1 += 'curl --output {} '.format(tmpfile)
-    cmd1 += '-J -L --referer \\";auto\\"  '
-    cmd1 += '--user-agent \\"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_5) AppleWebKit/537.36 '
-    cmd1 += '(KHTML, like Gecko) Chrome/68.0.3440.106 Safari/537.36\\" \\"{}\\"\"'.format(pdf_url)
-
-    cmd2 = 'scp -P {} -q {}@{}:{} {}'.format(port,
-                                             user, server, tmpfile, pdf_filename)
+    """
+    Download the PDF through a ssh proxy machine: curl runs on the remote host and
+        its output is streamed back over the same ssh connection into pdf_filename
+    note: a ControlMaster/ControlPersist entry for the server in ~/.ssh/config lets
+        repeated calls reuse one ssh connection
+    """
+    remote_cmd = 'curl -s -L --referer ";auto" --user-agent {} {}'.format(
+        shlex.quote(USER_AGENT),
+        shlex.quote(pdf_url))
+    cmd = ['ssh', '-p', str(port), '{}@{}'.format(user, server), remote_cmd]
 
     logger.debug("try >>> {}".format(pdf_url))
-    logger.debug("run >>> {}".format(cmd1))
-    subprocess.Popen(cmd1, shell=True,
-                     stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
-    logger.debug("run >>> {}".format(cmd2))
-    subprocess.Popen(cmd2, shell=True,
-                     stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
+    logger.debug("run >>> {}".format(' '.join(shlex.quote(x) for x in cmd)))
+    with open(pdf_filename, 'wb') as f:
+        subprocess.run(cmd, stdout=f, stderr=subprocess.PIPE)
 
     if 'PDF document' in get_filetype(pdf_filename):
         pdf_status = True
@@ -486,14 +842,31 @@ def get_esource_link(article_bibcode, esource_type='pub_pdf',
     return gateway_url+'/'+article_bibcode+'/'+esource_type.upper()
 
 
+def get_esource_links(article_bibcode, esource_types,
+                      gateway_url="https://ui.adsabs.harvard.edu/link_gateway"):
+    """
+    ADS esource urls of an article, keyed by esource_type (in the order of esource_types)
+        see get_esource_link()
+    """
+    article_gateway = gateway_url+'/'+article_bibcode+'/'
+    return {esource_type: article_gateway+esource_type.upper()
+            for esource_type in esource_types}
+
+
 def get_filetype(filename):
-    x = subprocess.Popen('file "{}"'.format(filename), shell=True,
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE).stdout.read()
+    """
+    Identify a file from its magic bytes (in-process, instead of spawning `file`)
+        PDFs are recognized directly; other types are described by python-magic if available
+    """
     try:
-        return x.decode()
-    except:
-        return x
+        with open(filename, 'rb') as f:
+            if f.read(5) == b'%PDF-':
+                return 'PDF document'
+        if magic is not None:
+            return magic.from_file(filename)
+    except Exception:
+        return ''
+    return 'data'
 
 
 def notify(title, subtitle, desc, alert_sound='Frog'):
@@ -1,6 +1,7 @@
 import logging
-import subprocess
 import os
+import re
+import struct
 
 import AppKit  # from pyobjc-framework-Cocoa
 app_info = AppKit.NSBundle.mainBundle().infoDictionary()
@@ -15,46 +16,84 @@ class BibDesk(object):
         """
         Manage BibDesk publications using AppKit
         """
-        self.app = AppKit.NSAppleScript.alloc()
+        # compiled AppleScript handlers, keyed by their source
+        self.scripts = {}
         self.refresh()
 
-    def __call__(self, cmd, pid=None, strlist=False, error=False):
+    def __call__(self, cmd, pid=None, strlist=False, error=False, args=()):
         """
         Run AppleScript command on first document of BibDesk
-        :param cmd: AppleScript command string
+        :param cmd: AppleScript command string, or a list of commands to run as a single script
+                    (the output is then the result of the last command)
         :param pid: address call to first/last publication of document
         :param strlist: return output as list of string
         :param error: return full output of call, including error
+        :param args: values (strings or lists of strings) available to the commands as
+                     `item 1 of args`, `item 2 of args`, ..., without any quoting
         """
-        if pid is None:
-            # address all publications
-            cmd = 'tell first document of application "BibDesk" to {}'.format(
-                cmd)
-        else:
+        if isinstance(cmd, str):
+            cmd = [cmd]
+        if pid is not None:
             # address a single publication
-            cmd = 'tell first document of application "BibDesk" to '\
-                  'tell first publication whose id is "{}" to {}'.format(
-                      pid, cmd)
-        output = self.app.initWithSource_(cmd).executeAndReturnError_(None)
+            cmd = ['tell first publication whose id is pid'] + cmd + ['end tell']
+        # address all publications
+        cmd = ['tell first document of application "BibDesk"'] + cmd + ['end tell']
+        output = self.run('\n'.join(cmd), pid=pid, args=args)
         if not error:
             output = output[0]
             if strlist:
-                # objective C nuisances...
-                output = [output.descriptorAtIndex_(i + 1).stringValue()
-                          for i in range(output.numberOfItems())]
+                output = as_strlist(output)
         return output
 
+    def run(self, body, pid=None, args=()):
+        """
+        Run AppleScript lines as the body of a handler `run_cmd(pid, args)`
+            the script is compiled only once per source, and pid/args are passed as
+            AppleEvent parameters rather than formatted into the source
+        """
+        source = 'on run_cmd(pid, args)\n{}\nend run_cmd'.format(body)
+        script = self.scripts.get(source)
+        if script is None:
+            script = AppKit.NSAppleScript.alloc().initWithSource_(source)
+            script.compileAndReturnError_(None)
+            self.scripts[source] = script
+
+        # kASAppleScriptSuite/kASSubroutineEvent, kAutoGenerateReturnID, kAnyTransactionID
+        event = AppKit.NSAppleEventDescriptor.appleEventWithEventClass_eventID_targetDescriptor_returnID_transactionID_(
+            fourcc('ascr'), fourcc('psbr'), AppKit.NSAppleEventDescriptor.nullDescriptor(), -1, 0)
+        # keyASSubroutineName: handler names are lower-cased by AppleScript
+        event.setParamDescriptor_forKeyword_(
+            AppKit.NSAppleEventDescriptor.descriptorWithString_('run_cmd'), fourcc('snam'))
+        # keyDirectObject: the positional parameters
+        event.setParamDescriptor_forKeyword_(
+            as_descriptor([pid, list(args)]), fourcc('----'))
+
+        return script.executeAppleEvent_error_(event, None)
+
+    def close(self):
+        """
+        Release the compiled AppleScript handlers
+        """
+        self.scripts.clear()
+
     def refresh(self):
         # is there an opened document yet?
         if self('return name of first document '
                 'of application "BibDesk"', error=True)[1] is not None:
             # create blank one
             self('tell application "BibDesk" to make new document')
-        self.titles = self('return title of publications', strlist=True)
-        self.ids = self('return id of publications', strlist=True)
+        # titles and ids in one round-trip
+        output = self('return {title of publications, id of publications}')
+        self.titles = as_strlist(output.descriptorAtIndex_(1))
+        self.ids = as_strlist(output.descriptorAtIndex_(2))
+        # title -> id index (the first publication wins for duplicated titles)
+        self.title_ids = dict(zip(reversed(self.titles), reversed(self.ids)))
+        # word tokens of each title, for the fuzzy title matching
+        self.title_tokens = [tokenize(t) for t in self.titles]
+        self.title_shingles = [set(tokens) for tokens in self.title_tokens]
 
     def pid(self, title):
-        return self.ids[self.titles.index(title)]
+        return self.title_ids[title]
 
     def authors(self, pid):
         """
@@ -62,6 +101,21 @@ class BibDesk(object):
         """
         return self('name of authors', pid, strlist=True)
 
+    def snapshot(self, pid):
+        """
+        Get the cite key, authors, abstract, fields and note of a publication
+        in a single AppleScript call
+        return a dict
+        """
+        output = self('return {cite key, name of authors, abstract, '
+                      'name of fields, value of fields, its note}', pid)
+        return {'cite_key': output.descriptorAtIndex_(1).stringValue(),
+                'authors': as_strlist(output.descriptorAtIndex_(2)),
+                'abstract': output.descriptorAtIndex_(3).stringValue(),
+                'field_names': as_strlist(output.descriptorAtIndex_(4)),
+                'field_values': as_strlist(output.descriptorAtIndex_(5)),
+                'note': output.descriptorAtIndex_(6).stringValue()}
+
     def safe_delete(self, pid):
         """
         Safely delete publication + PDFs, taking into account
@@ -106,20 +160,18 @@ class BibDesk(object):
         """
         cmd = """
             tell first document of application "BibDesk"
-            set oldPub to ( get first publication whose id is "{}" ) 
+            set oldPub to ( get first publication whose id is pid ) 
             set pGroups to ( get static groups whose publications contains oldPub ) 
-            set GroupNames to {{}}
+            set GroupNames to {}
             repeat with aGroup in pGroups 
                 copy (name of aGroup) to the end of GroupNames
             end repeat
             return GroupNames 
             end tell
-        """.format(pid)
+        """
 
-        output = self.app.initWithSource_(cmd).executeAndReturnError_(None)
-        output = output[0]
-        output = [output.descriptorAtIndex_(i + 1).stringValue()
-                  for i in range(output.numberOfItems())]
+        output = self.run(cmd, pid=pid)
+        output = as_strlist(output[0])
         logger.debug(
             "check static groups: pid: {}; static group: {}".format(pid, output))
         return output
@@ -128,32 +180,76 @@ class BibDesk(object):
         """
         add the publication into static groups
         note:
-            AppleScript lists are bracked by curly braces with items separate by commas
-            Each item is an alphanumeric label(?) or a string enclosed by double quotes or a list itself
-                e.g. { "group1", "groups" }
+            the group names are passed to the script as an AppleScript list parameter (args),
+            so names with quotes or backslashes need no escaping
             pid:         string
             groups:      list
         """
-        as_groups = ", ".join(['\"'+x+'\"' for x in groups])
         cmd = """
             tell first document of application "BibDesk"
-                set newPub to ( get first publication whose id is "{}" )
+                set newPub to ( get first publication whose id is pid )
                 #set AppleScript's text item delimiters to return
-                repeat with agroup in {{ {} }}
-                    set theGroup to get static group agroup
+                repeat with agroup in args
+                    set theGroup to get static group (contents of agroup)
                     add newPub to theGroup
                 end repeat
             end tell
-        """.format(pid, as_groups)
-        output = self.app.initWithSource_(cmd).executeAndReturnError_(None)
+        """
+        output = self.run(cmd, pid=pid, args=groups)
         new_groups = self.get_groups(pid)
         return new_groups
 
 
-def has_annotationss(f):
+def as_strlist(output):
+    """
+    Convert an AppleScript list descriptor into a list of strings
+    """
+    # objective C nuisances...
+    return [output.descriptorAtIndex_(i + 1).stringValue()
+            for i in range(output.numberOfItems())]
+
+
+def fourcc(code):
+    """
+    AppleEvent four-character code as an integer
+    """
+    return struct.unpack('>I', code.encode('ascii'))[0]
+
+
+def as_descriptor(value):
+    """
+    Convert a string, or a (nested) list of strings, into an AppleEvent descriptor
+    """
+    if isinstance(value, (list, tuple)):
+        output = AppKit.NSAppleEventDescriptor.listDescriptor()
+        for i, item in enumerate(value):
+            output.insertDescriptor_atIndex_(as_descriptor(item), i + 1)
+        return output
+    return AppKit.NSAppleEventDescriptor.descriptorWithString_(
+        '' if value is None else str(value))
+
+
+def tokenize(text):
+    """
+    Split a string into lower-case word tokens
+    """
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def has_annotationss(f, chunk_size=1024*1024):
     """
+    Check if a PDF file contains annotations (a "Contents (" entry),
+        scanning the file in chunks that overlap by the pattern length
     """
-    return subprocess.Popen(
-        "strings {} | grep  -E 'Contents[ ]{{0,1}}\('".format(f),
-        shell=True, stdout=subprocess.PIPE,
-        stderr=open('/dev/null', 'w')).stdout.read() != b''     # b''!=u'' in Python 3
+    pattern = re.compile(rb'Contents ?\(')
+    overlap = 10
+    try:
+        with open(f, 'rb') as fh:
+            tail = b''
+            for chunk in iter(lambda: fh.read(chunk_size), b''):
+                if pattern.search(tail+chunk):
+                    return True
+                tail = (tail+chunk)[-overlap:]
+    except OSError as err:
+        logger.debug("cannot scan {} for annotations: {}".format(f, err))
+    return False
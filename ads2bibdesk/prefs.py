@@ -14,6 +14,8 @@ class Preferences(object):
 
     def _get_prefs(self):
         """
+        Read the preference file once and return its settings as a plain dict
+            {section: {option: value}}, so later lookups skip ConfigParser's interpolation
         """
 
         prefs = ConfigParser(interpolation=ExtendedInterpolation())
@@ -27,6 +29,10 @@ class Preferences(object):
             ssh_server = None
             ssh_port = 22
 
+            [cache]
+            cache_dir = ~/.ads/cache
+            cache_days = 30
+
             [options]
             download_pdf = True
             remove_duplicate = True
@@ -44,4 +50,4 @@ class Preferences(object):
         else:
             prefs.read(self.prefs_path)
 
-        return prefs
+        return {s: dict(prefs.items(s)) for s in prefs.sections()}
@@ -142,6 +142,7 @@ setup(
         'ads2bibdesk = ads2bibdesk.ads2bibdesk:main']},
     python_requires='>=3.6, <4',
     install_requires=['ads', 'requests', 'lxml', 'pyobjc-framework-Cocoa'],
+    extras_require={'fast': ['rapidfuzz']},
     project_urls={'Bug Reports': 'https://github.com/r-xue/ads2bibdesk/issues',
                   'Source': 'https://github.com/r-xue/ads2bibdesk/'},
     cmdclass={'install': InstallCommand}